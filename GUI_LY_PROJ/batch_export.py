@@ -0,0 +1,195 @@
+# =====================================================
+# 🧬 Headless Proteome Batch Export
+# Computes lengths, amino acid compositions and header fields for whole
+# proteomes (or local FASTA files) across worker processes and streams
+# them to Parquet / Arrow IPC shards.
+#
+#   python batch_export.py --species Swiss-Prot --out swissprot_export
+#   python batch_export.py --fasta proteins.fasta.gz --out export --workers 8
+# =====================================================
+
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from proteome_utils import AMINO_ORDER, PROTEOME_IDS, aa_composition, download_proteome_fasta, parse_fasta, parse_header
+
+SCHEMA = pa.schema(
+    [
+        ("record", pa.int64()),
+        ("uniprot_id", pa.string()),
+        ("protein_name", pa.string()),
+        ("organism", pa.string()),
+        ("gene_name", pa.string()),
+        ("length", pa.int32()),
+    ]
+    + [(f"comp_{a}", pa.float32()) for a in AMINO_ORDER]
+)
+
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+# ----------------- Input Handling ----------------- #
+def resolve_input(args):
+    """Return a path to a plain (uncompressed) FASTA file for the requested input."""
+    os.makedirs(args.out, exist_ok=True)
+    if args.species:
+        path = os.path.join(args.out, f"_{args.species.replace(' ', '_').replace('.', '')}.fasta")
+        if not (args.reuse_download and os.path.exists(path)):
+            print(f"Downloading {args.species} to {path}...")
+            download_proteome_fasta(args.species, path + ".tmp")
+            # only a complete download ever replaces the cached copy
+            os.replace(path + ".tmp", path)
+        return path
+
+    if args.fasta.endswith(".gz"):
+        # Shards are addressed by byte offset, which needs a seekable plain file.
+        # The leading underscore keeps it out of pyarrow.dataset reads of `out`.
+        path = os.path.join(args.out, "_" + os.path.basename(args.fasta)[:-3])
+        if not (args.reuse_download and os.path.exists(path)):
+            print(f"Decompressing {args.fasta} to {path}...")
+            with gzip.open(args.fasta, "rb") as src, open(path + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(path + ".tmp", path)
+        return path
+    return args.fasta
+
+
+def publish_parts(staging, out):
+    """Replace every part-* file in `out` with the freshly written ones in `staging`."""
+    for name in os.listdir(out):
+        if name.startswith("part-"):
+            os.remove(os.path.join(out, name))
+    for name in sorted(os.listdir(staging)):
+        os.replace(os.path.join(staging, name), os.path.join(out, name))
+    os.rmdir(staging)
+
+
+def shard_ranges(path, shard_size, block_size=1 << 24):
+    """Split a FASTA file into (start, end, first_record) byte ranges of `shard_size` records."""
+    starts = []
+    count = 0
+    pos = 0
+    tail = b"\n"  # the file start behaves like the byte after a newline
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            buf = tail + block
+            i = buf.find(b"\n>")
+            while i != -1:
+                if count % shard_size == 0:
+                    starts.append(pos - len(tail) + i + 1)
+                count += 1
+                i = buf.find(b"\n>", i + 1)
+            tail = buf[-1:]
+            pos += len(block)
+
+    ends = starts[1:] + [pos]
+    return [(s, e, k * shard_size) for k, (s, e) in enumerate(zip(starts, ends))], count
+
+
+# ----------------- Worker ----------------- #
+def _open_writer(out_path, fmt):
+    if fmt == "parquet":
+        return pq.ParquetWriter(out_path, SCHEMA, compression="zstd")
+    return pa.ipc.new_file(out_path, SCHEMA)
+
+
+def _empty_columns():
+    return {name: [] for name in SCHEMA.names}
+
+
+def export_shard(path, start, end, first_record, out_path, fmt="parquet", min_length=20, batch_rows=8192):
+    """Parse one byte range of a FASTA file and write it as a single shard file."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+
+    writer = _open_writer(out_path, fmt)
+    cols = _empty_columns()
+    written = residues = 0
+    try:
+        for i, (header, seq) in enumerate(parse_fasta(text.splitlines()), start=first_record):
+            if len(seq) < min_length:
+                continue
+            info = parse_header(header)
+            cols["record"].append(i)
+            cols["uniprot_id"].append(info["uniprot_id"])
+            cols["protein_name"].append(info["protein_name"])
+            cols["organism"].append(info["organism"])
+            cols["gene_name"].append(info["gene_name"])
+            cols["length"].append(len(seq))
+            for a, pct in zip(AMINO_ORDER, aa_composition(seq)):
+                cols[f"comp_{a}"].append(pct)
+            written += 1
+            residues += len(seq)
+
+            if len(cols["record"]) >= batch_rows:
+                writer.write_table(pa.table(cols, schema=SCHEMA))
+                cols = _empty_columns()
+        if cols["record"]:
+            writer.write_table(pa.table(cols, schema=SCHEMA))
+    finally:
+        writer.close()
+    return out_path, written, residues
+
+
+# ----------------- CLI ----------------- #
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export per-protein lengths and compositions to Parquet/Arrow.")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--species", choices=list(PROTEOME_IDS) + ["Swiss-Prot"], help="UniProt proteome to download")
+    src.add_argument("--fasta", help="Local FASTA file (optionally .gz)")
+    parser.add_argument("--out", required=True, help="Output directory for shard files")
+    parser.add_argument("--format", choices=list(EXTENSIONS), default="parquet")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=20000, help="Records per shard")
+    parser.add_argument("--min-length", type=int, default=20, help="Skip sequences shorter than this")
+    parser.add_argument("--reuse-download", action="store_true",
+                        help="Reuse the FASTA cached in --out from a previous run instead of re-fetching it")
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    path = resolve_input(args)
+    shards, n_records = shard_ranges(path, args.shard_size)
+    print(f"{n_records:,} records in {len(shards)} shards, {args.workers} workers")
+
+    # Shards are staged in a hidden directory and swapped in only after every
+    # worker succeeds, so stale parts from an earlier run never linger.
+    staging = os.path.join(args.out, ".parts-tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    total = residues = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(
+                export_shard, path, start, end, first,
+                os.path.join(staging, f"part-{k:05d}{EXTENSIONS[args.format]}"),
+                args.format, args.min_length,
+            )
+            for k, (start, end, first) in enumerate(shards)
+        ]
+        for done, fut in enumerate(as_completed(futures), start=1):
+            out_path, written, n_res = fut.result()
+            total += written
+            residues += n_res
+            print(f"  [{done}/{len(shards)}] {os.path.basename(out_path)}: {written:,} proteins")
+    publish_parts(staging, args.out)
+
+    elapsed = time.time() - t0
+    print(f"Exported {total:,} proteins ({residues:,} residues) to {args.out} in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
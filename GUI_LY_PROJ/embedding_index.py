@@ -0,0 +1,465 @@
+# =====================================================
+# 🧬 Embedding Nearest-Neighbour Index
+# Finds the known proteins closest to a query in ESM-2 embedding space.
+#
+#   exact : brute force, blocked NumPy matrix multiplies
+#   ivf   : inverted file over spherical k-means lists; `nprobe` trades
+#           recall for latency
+#
+# Persisted as a directory of append-only vector segments, so new
+# proteins are added without rewriting what is already on disk.
+#
+#   python embedding_index.py build --fasta proteins.fasta --out protein_index --mode ivf
+#   python embedding_index.py bench --n 100000 --dim 320
+# =====================================================
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_ESM_MODEL = "facebook/esm2_t6_8M_UR50D"
+
+# From `bench --n 100000 --dim 320` (2000 overlapping clusters, sqrt(n) lists):
+# recall@10 is ~0.68 at nprobe=8, ~0.90 at 32 (~9 ms/query) and ~0.97 at 64
+DEFAULT_NPROBE = 32
+
+_ESM_CACHE = {}
+
+
+# ----------------- Embeddings ----------------- #
+def embed_sequences(sequences, model_name=DEFAULT_ESM_MODEL, batch_size=8, max_length=1024):
+    """Mean-pooled ESM-2 embeddings (CLS/EOS and padding excluded), shape (n, dim)."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    if model_name not in _ESM_CACHE:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        _ESM_CACHE[model_name] = (tokenizer, model)
+    tokenizer, model = _ESM_CACHE[model_name]
+
+    out = []
+    for start in range(0, len(sequences), batch_size):
+        batch = list(sequences[start:start + batch_size])
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=max_length)
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state          # (B, T, D)
+        mask = inputs["attention_mask"].clone()
+        mask[:, 0] = 0                                           # CLS
+        mask[torch.arange(mask.size(0)), inputs["attention_mask"].sum(1) - 1] = 0  # EOS
+        mask = mask.unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+        out.append(pooled.float().cpu().numpy())
+    return np.concatenate(out) if out else np.zeros((0, model.config.hidden_size), dtype=np.float32)
+
+
+# ----------------- Search Helpers ----------------- #
+def _topk(scores, k):
+    """Row-wise top-k of a (Q, M) score matrix, sorted descending."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64), np.zeros((scores.shape[0], 0), dtype=scores.dtype)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+# ----------------- Atomic Writes ----------------- #
+# Every file is written to `name.tmp` and renamed into place, so a reader (or
+# a crashed build) only ever sees complete files.
+def _save_npy(path, array):
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def _save_json(path, obj, **kwargs):
+    with open(path + ".tmp", "w") as f:
+        json.dump(obj, f, **kwargs)
+    os.replace(path + ".tmp", path)
+
+
+class EmbeddingIndex:
+    """
+    Inner-product index over embedding vectors.
+
+    With ``metric="cosine"`` vectors are L2-normalised on insert, so scores
+    are cosine similarities. ``model`` records which ESM-2 checkpoint produced
+    the vectors, so queries are embedded with the same one.
+    """
+
+    def __init__(self, dim, metric="cosine", nprobe=DEFAULT_NPROBE, model=DEFAULT_ESM_MODEL):
+        if metric not in ("cosine", "ip"):
+            raise ValueError(f"Unknown metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self.nprobe = nprobe
+        self.model = model
+        self.ids = []
+        self.labels = []
+        self.centroids = None
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._pending = []      # added since the last search; concatenated lazily
+        self._unsaved = []      # added since the last save; written as the next segment
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._lists = None
+        self._path = None
+        self._saved_rows = 0
+        self._segments = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self):
+        if self._pending:
+            self._vectors = np.concatenate([self._vectors] + self._pending)
+            self._pending = []
+        return self._vectors
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    # ----------------- Inserts ----------------- #
+    def _prepare(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}")
+        return _normalize(vectors) if self.metric == "cosine" else vectors
+
+    def add(self, ids, vectors, labels=None):
+        """Append vectors; if the IVF quantizer is trained they join their nearest list."""
+        vectors = self._prepare(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError(f"{len(ids)} ids but {len(vectors)} vectors")
+        self.ids.extend(ids)
+        self.labels.extend(labels if labels is not None else [""] * len(ids))
+        self._pending.append(vectors)
+        self._unsaved.append(vectors)
+        if self.trained:
+            self._assign = np.concatenate([self._assign, self._nearest_centroid(vectors)])
+            self._lists = None
+
+    def train(self, n_lists, iters=20, sample_size=None, seed=0):
+        """Fit the IVF coarse quantizer with spherical k-means and assign every vector."""
+        x = self.vectors
+        if len(x) < n_lists:
+            raise ValueError(f"Need at least {n_lists} vectors to train {n_lists} lists, have {len(x)}")
+        rng = np.random.default_rng(seed)
+        sample_size = sample_size or min(len(x), 256 * n_lists)
+        sample = x[rng.choice(len(x), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=n_lists)
+            order = np.argsort(assign, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            nonempty = counts > 0
+            sums = np.zeros_like(centroids)
+            sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+            empty = counts == 0
+            # re-seed empty lists from random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            counts[empty] = 1
+            centroids = sums / counts[:, None]
+            if self.metric == "cosine":
+                centroids = _normalize(centroids)
+
+        self.centroids = centroids.astype(np.float32)
+        self._assign = self._nearest_centroid(x)
+        self._lists = None
+
+    def _nearest_centroid(self, vectors, block_size=65536):
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            out[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ self.centroids.T, axis=1)
+        return out
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self._assign, kind="stable")
+            bounds = np.searchsorted(self._assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    # ----------------- Search ----------------- #
+    def search(self, queries, k=10, mode=None, nprobe=None, block_size=16384):
+        """
+        Return (rows, scores), each shaped (n_queries, k), best match first.
+        ``rows`` index into ``self.ids`` / ``self.labels``; missing slots are -1.
+        """
+        queries = self._prepare(queries)
+        mode = mode or ("ivf" if self.trained else "exact")
+        if mode == "exact":
+            rows, scores = self._search_exact(queries, k, block_size)
+        elif mode == "ivf":
+            if not self.trained:
+                raise ValueError("IVF search requires train() first")
+            rows, scores = self._search_ivf(queries, k, nprobe or self.nprobe)
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+
+        if rows.shape[1] < k:  # fewer candidates than k
+            pad = k - rows.shape[1]
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+            scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+        return rows, scores
+
+    def _search_exact(self, queries, k, block_size):
+        x = self.vectors
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(x), block_size):
+            rows, scores = _topk(queries @ x[start:start + block_size].T, k)
+            rows = np.concatenate([best_rows, rows + start], axis=1)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            keep, best_scores = _topk(scores, k)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+        return best_rows, best_scores
+
+    def _search_ivf(self, queries, k, nprobe):
+        x = self.vectors
+        order, bounds = self._inverted_lists()
+        probes, _ = _topk(queries @ self.centroids.T, nprobe)
+
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for qi, q in enumerate(queries):
+            cand = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probes[qi]])
+            if len(cand) == 0:
+                continue
+            rows, scores = _topk((x[cand] @ q)[None, :], k)
+            all_rows[qi, :rows.shape[1]] = cand[rows[0]]
+            all_scores[qi, :rows.shape[1]] = scores[0]
+        return all_rows, all_scores
+
+    # ----------------- Persistence ----------------- #
+    def save(self, path):
+        """Write new vectors as a fresh segment; existing segments are left untouched."""
+        if path != self._path:
+            # a new location gets everything as its first segment
+            os.makedirs(path, exist_ok=True)
+            self._path, self._saved_rows, self._segments = path, 0, 0
+            self._unsaved = [self.vectors]
+
+        # only the unsaved tail is touched, so per-chunk saves during `build`
+        # never copy the whole (possibly huge) vector array
+        if len(self) > self._saved_rows:
+            seg = f"{self._segments:05d}"
+            _save_npy(os.path.join(path, f"vectors-{seg}.npy"), np.concatenate(self._unsaved))
+            _save_json(os.path.join(path, f"ids-{seg}.json"),
+                       {"ids": self.ids[self._saved_rows:], "labels": self.labels[self._saved_rows:]})
+            self._segments += 1
+            self._saved_rows = len(self)
+        self._unsaved = []
+
+        # the quantizer is small, so it is rewritten whole
+        if self.trained:
+            _save_npy(os.path.join(path, "centroids.npy"), self.centroids)
+            _save_npy(os.path.join(path, "assign.npy"), self._assign)
+
+        meta = {
+            "dim": self.dim,
+            "metric": self.metric,
+            "nprobe": self.nprobe,
+            "model": self.model,
+            "rows": len(self),
+            "segments": self._segments,
+            "trained": self.trained,
+        }
+        # meta.json goes last: it is what `load` and the app's cache key read,
+        # so the new segment and quantizer only become visible once complete
+        _save_json(os.path.join(path, "meta.json"), meta, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        index = cls(meta["dim"], metric=meta["metric"], nprobe=meta["nprobe"],
+                    model=meta.get("model", DEFAULT_ESM_MODEL))
+
+        for s in range(meta["segments"]):
+            seg = f"{s:05d}"
+            index._pending.append(np.load(os.path.join(path, f"vectors-{seg}.npy")))
+            with open(os.path.join(path, f"ids-{seg}.json"), "r") as f:
+                names = json.load(f)
+            index.ids.extend(names["ids"])
+            index.labels.extend(names["labels"])
+
+        if meta["trained"]:
+            index.centroids = np.load(os.path.join(path, "centroids.npy"))
+            index._assign = np.load(os.path.join(path, "assign.npy"))
+            if len(index._assign) != len(index) or len(index.centroids) <= index._assign.max(initial=-1):
+                # a save was interrupted between the quantizer files and meta.json
+                raise ValueError(f"{path}: IVF quantizer does not match meta.json; rebuild with --retrain")
+
+        index._path, index._saved_rows, index._segments = path, len(index), meta["segments"]
+        return index
+
+
+# ----------------- CLI ----------------- #
+def build(args):
+    from proteome_utils import parse_fasta, parse_header
+
+    index = EmbeddingIndex.load(args.out) if os.path.exists(os.path.join(args.out, "meta.json")) else None
+    known = set(index.ids) if index else set()
+    if index and args.model and args.model != index.model:
+        raise SystemExit(f"{args.out} was built with {index.model}; cannot add {args.model} embeddings")
+    model = index.model if index else (args.model or DEFAULT_ESM_MODEL)
+
+    def flush(ids, labels, seqs):
+        nonlocal index
+        vectors = embed_sequences(seqs, model_name=model, batch_size=args.batch_size)
+        if index is None:
+            index = EmbeddingIndex(vectors.shape[1], nprobe=args.nprobe, model=model)
+        index.add(ids, vectors, labels)
+        index.save(args.out)
+        print(f"  indexed {len(index):,} proteins")
+
+    ids, labels, seqs = [], [], []
+    with open(args.fasta, "r") as f:
+        for header, seq in parse_fasta(f):
+            info = parse_header(header)
+            if len(seq) < args.min_length or info["uniprot_id"] in known:
+                continue
+            known.add(info["uniprot_id"])
+            ids.append(info["uniprot_id"])
+            labels.append(info["protein_name"])
+            seqs.append(seq)
+            if len(seqs) >= args.chunk_size:
+                flush(ids, labels, seqs)
+                ids, labels, seqs = [], [], []
+    if seqs:
+        flush(ids, labels, seqs)
+
+    if index is None:
+        print("No new proteins to index.")
+        return
+    if args.mode == "ivf" and (args.retrain or not index.trained):
+        n_lists = args.n_lists or max(1, int(np.sqrt(len(index))))
+        print(f"Training IVF quantizer with {n_lists} lists...")
+        index.train(n_lists)
+        index.save(args.out)
+    print(f"Index at {args.out}: {len(index):,} proteins")
+
+
+def _synthetic_embeddings(n, dim, n_clusters, noise, rng):
+    """
+    Clustered vectors shaped like mean-pooled ESM embeddings: a large shared
+    offset, a decaying per-dimension spread (anisotropic) and within-family
+    noise on the order of the spread between families, so clusters overlap.
+    """
+    scale = 1.0 / np.sqrt(1.0 + np.arange(dim) / 8.0)
+    offset = 2.0 * rng.standard_normal(dim) * scale
+    centers = rng.standard_normal((n_clusters, dim)) * scale
+    labels = rng.integers(0, n_clusters, n)
+    return (offset + centers[labels] + noise * rng.standard_normal((n, dim)) * scale).astype(np.float32)
+
+
+def _fasta_embeddings(path, n, model_name, batch_size, min_length=20):
+    from proteome_utils import parse_fasta
+
+    seqs = []
+    with open(path, "r") as f:
+        for _, seq in parse_fasta(f):
+            if len(seq) >= min_length:
+                seqs.append(seq)
+            if len(seqs) >= n:
+                break
+    print(f"Embedding {len(seqs):,} sequences from {path} with {model_name}...")
+    return embed_sequences(seqs, model_name=model_name, batch_size=batch_size)
+
+
+def bench(args):
+    rng = np.random.default_rng(args.seed)
+    total = args.n + args.queries
+    if args.fasta:
+        vectors = _fasta_embeddings(args.fasta, total, args.model, args.batch_size)
+    else:
+        vectors = _synthetic_embeddings(total, args.dim, args.clusters, args.noise, rng)
+    # held-out queries: no query is itself in the index
+    vectors = vectors[rng.permutation(len(vectors))]
+    queries, data = vectors[:args.queries], vectors[args.queries:]
+    args.n, args.dim = data.shape
+
+    index = EmbeddingIndex(args.dim)
+    index.add([str(i) for i in range(args.n)], data)
+    t0 = time.perf_counter()
+    index.train(args.n_lists or int(np.sqrt(args.n)))
+    print(f"{args.n:,} x {args.dim} vectors, {len(index.centroids)} lists, trained in {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    truth, _ = index.search(queries, k=args.k, mode="exact")
+    exact_ms = 1000 * (time.perf_counter() - t0) / args.queries
+    t0 = time.perf_counter()
+    for q in queries[:50]:
+        index.search(q, k=args.k, mode="exact")
+    single_ms = 1000 * (time.perf_counter() - t0) / min(50, args.queries)
+    print(f"{'exact (batched)':<18}{exact_ms:>10.3f} ms/query   recall@{args.k} 1.000")
+    print(f"{'exact (single)':<18}{single_ms:>10.3f} ms/query   recall@{args.k} 1.000")
+
+    for nprobe in args.nprobe_sweep:
+        t0 = time.perf_counter()
+        rows, _ = index.search(queries, k=args.k, mode="ivf", nprobe=nprobe)
+        ms = 1000 * (time.perf_counter() - t0) / args.queries
+        recall = np.mean([len(set(r) & set(t)) / args.k for r, t in zip(rows, truth)])
+        print(f"{'ivf nprobe=' + str(nprobe):<18}{ms:>10.3f} ms/query   recall@{args.k} {recall:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ESM-2 embedding nearest-neighbour index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="Embed a FASTA file and add it to an index (incremental)")
+    b.add_argument("--fasta", required=True)
+    b.add_argument("--out", default="protein_index")
+    b.add_argument("--mode", choices=["exact", "ivf"], default="exact")
+    b.add_argument("--n-lists", type=int, default=None, help="IVF lists (default sqrt(n))")
+    b.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE,
+                   help="IVF lists scanned per query; recall@10 on the synthetic bench is ~0.68 at 8, "
+                        "~0.90 at 32, ~0.97 at 64 (default %(default)s)")
+    b.add_argument("--retrain", action="store_true", help="Refit the IVF quantizer on all vectors")
+    b.add_argument("--model", default=None,
+                   help=f"ESM-2 checkpoint (default: the index's own, or {DEFAULT_ESM_MODEL} for a new index)")
+    b.add_argument("--batch-size", type=int, default=8)
+    b.add_argument("--chunk-size", type=int, default=1024, help="Proteins embedded per saved segment")
+    b.add_argument("--min-length", type=int, default=20)
+
+    m = sub.add_parser("bench", help="Latency / recall on synthetic or real (--fasta) embeddings")
+    m.add_argument("--n", type=int, default=100000)
+    m.add_argument("--dim", type=int, default=320)
+    m.add_argument("--queries", type=int, default=200)
+    m.add_argument("--k", type=int, default=10)
+    m.add_argument("--clusters", type=int, default=2000)
+    m.add_argument("--noise", type=float, default=1.0, help="Within-cluster spread relative to between-cluster spread")
+    m.add_argument("--fasta", help="Benchmark real ESM-2 embeddings of this FASTA instead of synthetic vectors")
+    m.add_argument("--model", default=DEFAULT_ESM_MODEL)
+    m.add_argument("--batch-size", type=int, default=8)
+    m.add_argument("--n-lists", type=int, default=None)
+    m.add_argument("--nprobe-sweep", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    m.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        build(args)
+    else:
+        bench(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# =====================================================
+# 🧬 Proteome fetch / parse helpers
+# Shared by the Streamlit app and the batch exporter.
+# Kept free of Streamlit imports so worker processes can use it.
+# =====================================================
+
+import gzip
+import zlib
+from io import BytesIO
+from collections import Counter
+
+import requests
+
+AMINO_ORDER = list("ACDEFGHIKLMNPQRSTVWY")
+
+PROTEOME_IDS = {
+    "Human": "UP000005640",
+    "Mouse": "UP000000589",
+    "Fruit Fly": "UP000000803",
+    "E. coli": "UP000000625",
+    "Yeast": "UP000002311",
+}
+
+BASE_URL = "https://rest.uniprot.org"
+
+
+def proteome_query(species):
+    """Build the UniProt query for reviewed entries of a species ("Swiss-Prot" = all of it)."""
+    if species == "Swiss-Prot":
+        return "(reviewed:true)"
+    return f"(proteome:{PROTEOME_IDS[species]})+AND+(reviewed:true)"
+
+
+def proteome_url(species):
+    """Compressed FASTA stream URL for a species."""
+    return f"{BASE_URL}/uniprotkb/stream?format=fasta&query={proteome_query(species)}&compressed=true"
+
+
+def fetch_proteome_fasta(species, timeout=120):
+    """Download a proteome and return the decompressed FASTA text."""
+    r = requests.get(proteome_url(species), stream=True, timeout=timeout)
+    r.raise_for_status()
+    data = b"".join(r.iter_content(8192))
+    with gzip.GzipFile(fileobj=BytesIO(data)) as gz:
+        return gz.read().decode("utf-8")
+
+
+def download_proteome_fasta(species, path, timeout=300, chunk_size=1 << 20):
+    """Stream a proteome to `path` as plain FASTA without holding it in memory."""
+    r = requests.get(proteome_url(species), stream=True, timeout=timeout)
+    r.raise_for_status()
+    inflate = zlib.decompressobj(zlib.MAX_WBITS | 16)  # gzip container
+    with open(path, "wb") as out:
+        for chunk in r.iter_content(chunk_size):
+            out.write(inflate.decompress(chunk))
+        out.write(inflate.flush())
+    return path
+
+
+def parse_fasta(lines):
+    """Yield (header, sequence) pairs from FASTA text or an iterable of lines."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    header, sequence = None, []
+    for line in lines:
+        if line.startswith(">"):
+            if header:
+                yield header, "".join(sequence)
+            header, sequence = line[1:].rstrip(), []
+        else:
+            sequence.append(line.strip())
+    if header:
+        yield header, "".join(sequence)
+
+
+def parse_header(header):
+    """Extract UniProt ID, name, organism and gene from a FASTA header."""
+    p0 = header.split("|")
+    return {
+        "uniprot_id": p0[1] if len(p0) >= 3 else "Unknown",
+        "protein_name": header.split(" OS=")[0],
+        "organism": (header.split("OS=")[1].split("OX=")[0].strip() if "OS=" in header else "Unknown"),
+        "gene_name": (header.split("GN=")[1].split()[0] if "GN=" in header else "Unknown"),
+    }
+
+
+def aa_composition(seq):
+    """Compute amino acid composition percentages."""
+    c = Counter(seq)
+    return [100 * c.get(a, 0) / len(seq) for a in AMINO_ORDER]
@@ -4,14 +4,16 @@
 # =====================================================
 
 import streamlit as st
-import requests, gzip
-from io import BytesIO
-from collections import Counter
+import requests
+from itertools import islice
 from matplotlib import pyplot as plt
 import py3Dmol
 import base64
 import os
 
+from proteome_utils import AMINO_ORDER, aa_composition, fetch_proteome_fasta, parse_fasta, parse_header
+from embedding_index import EmbeddingIndex, embed_sequences
+
 # ----------------- Streamlit Page Setup ----------------- #
 st.set_page_config(
     page_title="Protein Structure Prediction and Visualization",
@@ -526,66 +528,62 @@ hero_html = f"""
 st.markdown(hero_html, unsafe_allow_html=True)
 
 # ----------------- Helper Functions ----------------- #
-AMINO_ORDER = list("ACDEFGHIKLMNPQRSTVWY")
-
 @st.cache_data(show_spinner=False)
 def get_proteome_data(species, max_seq=200):
     """Fetch Swiss-Prot reviewed sequences from UniProt REST API."""
-    proteome_ids = {
-        "Human": "UP000005640",
-        "Mouse": "UP000000589",
-        "Fruit Fly": "UP000000803",
-        "E. coli": "UP000000625",
-        "Yeast": "UP000002311",
-    }
-    base_url = "https://rest.uniprot.org"
-    pid = proteome_ids[species]
-    url = f"{base_url}/uniprotkb/stream?format=fasta&query=(proteome:{pid})+AND+(reviewed:true)&compressed=true"
-
     try:
-        r = requests.get(url, stream=True, timeout=120)
-        r.raise_for_status()
-        data = b"".join(r.iter_content(8192))
-        with gzip.GzipFile(fileobj=BytesIO(data)) as gz:
-            fasta = gz.read().decode("utf-8")
+        fasta = fetch_proteome_fasta(species)
     except Exception as e:
         st.error(f"Error fetching data: {e}")
         return []
 
-    seqs, header, sequence = [], None, []
-    for line in fasta.splitlines():
-        if line.startswith(">"):
-            if header:
-                seqs.append({"header": header, "sequence": "".join(sequence)})
-            header, sequence = line[1:], []
-        else:
-            sequence.append(line.strip())
-    if header:
-        seqs.append({"header": header, "sequence": "".join(sequence)})
-
     data = []
-    for s in seqs[:max_seq]:
-        header = s["header"]
-        seq = s["sequence"]
+    for header, seq in islice(parse_fasta(fasta), max_seq):
         if len(seq) < 20:
             continue
-        p0 = header.split("|")
-        info = {
-            "uniprot_id": p0[1] if len(p0) >= 3 else "Unknown",
-            "protein_name": header.split(" OS=")[0],
-            "organism": (header.split("OS=")[1].split("OX=")[0].strip() if "OS=" in header else "Unknown"),
-            "gene_name": (header.split("GN=")[1].split()[0] if "GN=" in header else "Unknown"),
-            "sequence": seq,
-            "length": len(seq)
-        }
+        info = parse_header(header)
+        info["sequence"] = seq
+        info["length"] = len(seq)
         data.append(info)
     return data
 
 
-def aa_composition(seq):
-    """Compute amino acid composition percentages."""
-    c = Counter(seq)
-    return [100 * c.get(a, 0) / len(seq) for a in AMINO_ORDER]
+# Built with: python embedding_index.py build --fasta <proteome.fasta> --out protein_index
+INDEX_DIR = os.environ.get(
+    "PROTEIN_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "protein_index"),
+)
+
+
+# one entry: a rebuild changes `version`, and the superseded index (vectors and
+# all) is evicted instead of staying resident next to the new one
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_embedding_index(path, version):
+    """Load the persisted ESM-2 embedding index; `version` (meta.json mtime) picks up rebuilds."""
+    return EmbeddingIndex.load(path)
+
+
+def index_version(path):
+    """Changes whenever `embedding_index.py build` adds proteins and rewrites meta.json."""
+    return os.path.getmtime(os.path.join(path, "meta.json"))
+
+
+@st.cache_data(show_spinner=False)
+def find_similar_proteins(uniprot_id, sequence, version, k=10):
+    """Nearest neighbours of a sequence in embedding space, excluding itself."""
+    index = load_embedding_index(INDEX_DIR, version)
+    # queries must come from the checkpoint the index was built with
+    rows, scores = index.search(embed_sequences([sequence], model_name=index.model), k=k + 1)
+    hits = []
+    for row, score in zip(rows[0], scores[0]):
+        if row < 0 or index.ids[row] == uniprot_id:
+            continue
+        hits.append({
+            "UniProt ID": index.ids[row],
+            "Protein": index.labels[row],
+            "Cosine Similarity": round(float(score), 3),
+        })
+    return hits[:k]
 
 
 def show_3d_structure(uniprot_id):
@@ -709,6 +707,22 @@ else:
         seq_display = "\n".join(p["sequence"][i:i+80] for i in range(0, len(p["sequence"]), 80))
         st.text_area("Protein Sequence", seq_display, height=250)
 
+        # Structurally similar proteins (nearest neighbours in ESM-2 embedding space)
+        st.subheader("🔗 Structurally Similar Proteins")
+        if not os.path.exists(os.path.join(INDEX_DIR, "meta.json")):
+            st.info(f"No embedding index found at {INDEX_DIR}. Build one with embedding_index.py.")
+        elif st.button("Find Similar Proteins"):
+            try:
+                with st.spinner("Embedding and searching..."):
+                    hits = find_similar_proteins(p["uniprot_id"], p["sequence"], index_version(INDEX_DIR))
+            except Exception as e:
+                st.error(f"Error searching embedding index: {e}")
+                hits = None
+            if hits:
+                st.table(hits)
+            elif hits is not None:
+                st.warning("No similar proteins found in the index.")
+
 st.markdown("</div>", unsafe_allow_html=True)
 
 # ----------------- Section 4: 3D Viewer ----------------- #
@@ -0,0 +1,372 @@
+"""
+Columnar on-disk protein dataset.
+
+Replaces ``combined_protein_dataset.json`` with one uncompressed Arrow IPC file
+per species, so a dataset is opened by memory-mapping rather than parsing:
+
+    protein_dataset/
+        manifest.json
+        species=human/data.arrow
+        species=mouse/data.arrow
+        ...
+
+Rows are addressed by a global index (partitions concatenated in manifest
+order), which makes train/val splits plain index arrays that can be
+regenerated exactly from a seed.
+
+    python protein_dataset.py convert combined_protein_dataset.json protein_dataset
+    python protein_dataset.py bench --json combined_protein_dataset.json --dataset protein_dataset
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+
+SCHEMA = pa.schema([
+    ("uniprot_id", pa.string()),
+    ("gene_name", pa.string()),
+    ("protein_name", pa.string()),
+    ("organism", pa.string()),
+    ("length", pa.int32()),
+    ("sequence", pa.large_string()),   # 64-bit offsets: no 2 GiB cap per partition
+])
+
+MANIFEST = "manifest.json"
+PARTITION_FILE = "data.arrow"
+STAGING_DIR = ".staging"
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+TOKEN2IDX = {aa: i + 1 for i, aa in enumerate(AMINO_ACIDS)}   # same ids as Model_Train
+
+
+# -----------------------
+# Writing
+# -----------------------
+def write_dataset(sequences, metadata, root, collection_info=None):
+    """
+    Write aligned ``sequences`` / ``metadata`` lists (the layout produced by
+    ``create_combined_dataset``) as a species-partitioned dataset under ``root``.
+    """
+    if len(sequences) != len(metadata):
+        raise ValueError(f"{len(sequences)} sequences but {len(metadata)} metadata rows")
+
+    # group row indices by species, keeping first-seen species order
+    by_species = {}
+    for i, meta in enumerate(metadata):
+        by_species.setdefault(meta["species"], []).append(i)
+
+    # Partitions are written to a staging directory and swapped in afterwards,
+    # so partitions from an earlier write never survive next to the new ones.
+    staging = os.path.join(root, STAGING_DIR)
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    partitions = []
+    for species, rows in by_species.items():
+        table = pa.table({
+            "uniprot_id": [metadata[i]["uniprot_id"] for i in rows],
+            "gene_name": [metadata[i]["gene_name"] for i in rows],
+            "protein_name": [metadata[i]["protein_name"] for i in rows],
+            "organism": [metadata[i]["organism"] for i in rows],
+            "length": [len(sequences[i]) for i in rows],
+            "sequence": [sequences[i] for i in rows],
+        }, schema=SCHEMA)
+
+        part_dir = f"species={species}"
+        os.makedirs(os.path.join(staging, part_dir))
+        # uncompressed and a single record batch, so reads are zero-copy mmaps
+        with pa.ipc.new_file(os.path.join(staging, part_dir, PARTITION_FILE), SCHEMA) as writer:
+            writer.write_table(table, max_chunksize=len(rows))
+        partitions.append({"species": species, "path": os.path.join(part_dir, PARTITION_FILE), "rows": len(rows)})
+
+    manifest = {
+        "format": "arrow-ipc",
+        "partitions": partitions,
+        "total_sequences": len(sequences),
+        "collection_info": collection_info or {},
+    }
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    _publish(staging, root)
+    return manifest
+
+
+def _publish(staging, root):
+    """Replace the manifest and every species=* partition in ``root`` with those in ``staging``."""
+    manifest_path = os.path.join(root, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)   # readers see no dataset rather than a mixed one
+    for name in os.listdir(root):
+        if name.startswith("species="):
+            shutil.rmtree(os.path.join(root, name))
+    for name in os.listdir(staging):
+        if name != MANIFEST:
+            os.replace(os.path.join(staging, name), os.path.join(root, name))
+    os.replace(os.path.join(staging, MANIFEST), manifest_path)   # manifest last
+    os.rmdir(staging)
+
+
+def convert_json(json_path, root):
+    """Convert an existing ``combined_protein_dataset.json`` into the columnar layout."""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    return write_dataset(data["sequences"], data["metadata"], root, data.get("collection_info"))
+
+
+# -----------------------
+# Reading
+# -----------------------
+class ProteinDataset:
+    """
+    Memory-mapped view over a dataset written by ``write_dataset``.
+
+    Opening only maps the partition files. ``codes`` / ``encode`` return
+    NumPy views of a sequence's bytes straight from the mapped buffers, so a
+    training ``Dataset`` can keep just an index array and tokenize lazily.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, MANIFEST), "r") as f:
+            self.manifest = json.load(f)
+
+        self.species = []
+        self.tables = []
+        for part in self.manifest["partitions"]:
+            source = pa.memory_map(os.path.join(root, part["path"]), "r")
+            self.tables.append(pa.ipc.open_file(source).read_all())
+            self.species.append(part["species"])
+
+        # (offsets, bytes) NumPy views over each partition's sequence buffers
+        self._buffers = []
+        for t in self.tables:
+            col = t.column("sequence")
+            chunk = col.chunk(0) if col.num_chunks == 1 else col.combine_chunks()
+            _, offsets, data = chunk.buffers()
+            self._buffers.append((
+                np.frombuffer(offsets, dtype=np.int64, count=len(chunk) + 1, offset=chunk.offset * 8),
+                np.frombuffer(data, dtype=np.uint8),
+            ))
+        sizes = [t.num_rows for t in self.tables]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _locate(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"index {idx} out of range for {len(self)} sequences")
+        part = int(np.searchsorted(self.offsets, idx, side="right")) - 1
+        return part, idx - int(self.offsets[part])
+
+    def codes(self, idx):
+        """Zero-copy uint8 view of one sequence's ASCII residue codes."""
+        part, local = self._locate(int(idx))
+        offsets, data = self._buffers[part]
+        return data[offsets[local]:offsets[local + 1]]
+
+    def encode(self, idx, lookup, max_len=None):
+        """
+        Token ids for one sequence via a 256-entry byte ``lookup`` (see
+        ``residue_lookup``); residues mapping to 0 are dropped.
+        """
+        tokens = lookup[self.codes(idx)]
+        tokens = tokens[tokens != 0]
+        return tokens[:max_len] if max_len is not None else tokens
+
+    def token_counts(self, lookup, block_rows=65536):
+        """Per-row count of residues ``lookup`` keeps, computed with NumPy over the mapped bytes."""
+        drop = lookup == 0
+        counts = []
+        for offsets, data in self._buffers:
+            for start in range(0, len(offsets) - 1, block_rows):
+                bounds = offsets[start:start + block_rows + 1]
+                # dropped residues are rare, so locate them instead of summing every byte
+                dropped = np.flatnonzero(drop[data[bounds[0]:bounds[-1]]])
+                per_row = np.diff(np.searchsorted(dropped, bounds - bounds[0]))
+                counts.append(np.diff(bounds) - per_row)
+        return np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+
+    def sequence(self, idx):
+        return self.codes(idx).tobytes().decode("ascii")
+
+    def sequences(self, indices=None):
+        """Yield sequences for ``indices`` (all rows, in order, if omitted)."""
+        for idx in range(len(self)) if indices is None else indices:
+            yield self.sequence(idx)
+
+    def metadata(self, idx):
+        part, local = self._locate(int(idx))
+        row = self.tables[part].slice(local, 1).to_pylist()[0]
+        del row["sequence"]
+        row["species"] = self.species[part]
+        return row
+
+    def species_indices(self, species):
+        """Global index range covered by one species partition."""
+        part = self.species.index(species)
+        return np.arange(self.offsets[part], self.offsets[part + 1])
+
+    def lengths(self):
+        return np.concatenate([t.column("length").to_numpy() for t in self.tables])
+
+
+def open_dataset(root):
+    return ProteinDataset(root)
+
+
+def residue_lookup(token2idx):
+    """Byte -> token id table for ``ProteinDataset.encode``; unknown bytes map to 0."""
+    lookup = np.zeros(256, dtype=np.int64)
+    for aa, idx in token2idx.items():
+        lookup[ord(aa)] = idx
+    return lookup
+
+
+def train_val_split(n, val_fraction=0.1, seed=42):
+    """
+    Deterministic index split: the same ``n`` / ``val_fraction`` / ``seed``
+    always yields the same (train_idx, val_idx) arrays.
+    """
+    perm = np.random.default_rng(seed).permutation(n)
+    n_train = int((1 - val_fraction) * n)
+    return np.sort(perm[:n_train]), np.sort(perm[n_train:])
+
+
+# -----------------------
+# Load-time / RSS benchmark
+# -----------------------
+def _peak_rss_mb():
+    # ru_maxrss survives fork + exec on Linux, so a child would report the
+    # parent's peak; VmHWM belongs to this process's own address space
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(mode, path, max_len=512):
+    """
+    Time one way of getting from disk to a ready training set:
+
+    json-train      json.load + shuffle + eager tokenization into int lists
+                    (what Model_Train did before)
+    columnar-train  open + index split + token-count filter: all a lazy Dataset
+                    needs before the first batch
+    columnar-epoch  columnar-train plus tokenizing every row once, i.e. the
+                    per-epoch cost the lazy Dataset pays inside __getitem__
+    """
+    start = time.perf_counter()
+    if mode == "json-train":
+        with open(path, "r") as f:
+            sequences = json.load(f)["sequences"]
+        random.shuffle(sequences)
+        samples = []
+        for seq in sequences:
+            tokenized = [TOKEN2IDX[aa] for aa in seq if aa in TOKEN2IDX]
+            if len(tokenized) >= 2:
+                samples.append(tokenized[:max_len])
+        n = len(samples)
+    elif mode in ("columnar-train", "columnar-epoch"):
+        dataset = open_dataset(path)
+        train_idx, val_idx = train_val_split(len(dataset))
+        lookup = residue_lookup(TOKEN2IDX)
+        counts = dataset.token_counts(lookup)
+        train_idx = train_idx[counts[train_idx] >= 2]
+        val_idx = val_idx[counts[val_idx] >= 2]
+        n = len(train_idx) + len(val_idx)
+        if mode == "columnar-epoch":
+            for idx in range(len(dataset)):
+                dataset.encode(idx, lookup, max_len)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"mode": mode, "sequences": n, "seconds": elapsed, "peak_rss_mb": _peak_rss_mb()}))
+
+
+def write_synthetic(json_path, root, species_counts, seed=0):
+    """A stand-in collection with realistic lengths (log-normal, median ~370 aa)."""
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)
+    sequences, metadata = [], []
+    for species, count in species_counts.items():
+        for i, length in enumerate(np.clip(rng.lognormal(5.9, 0.7, count).astype(int), 20, 35000)):
+            seq = letters[rng.integers(0, len(letters), length)].tobytes().decode()
+            sequences.append(seq)
+            metadata.append({
+                "species": species, "uniprot_id": f"{species[:2].upper()}{i:06d}", "gene_name": f"g{i}",
+                "protein_name": f"Synthetic protein {i}", "length": len(seq), "organism": species,
+            })
+    with open(json_path, "w") as f:
+        json.dump({"sequences": sequences, "metadata": metadata, "collection_info": {}}, f, indent=2)
+    write_dataset(sequences, metadata, root)
+
+
+def benchmark(json_path, root):
+    """Run each loader in a fresh interpreter so peak RSS is not shared between them."""
+    runs = [("json-train", json_path), ("columnar-train", root), ("columnar-epoch", root)]
+    results = []
+    for mode, path in runs:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "_measure", mode, path],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<16}{'sequences':>12}{'seconds':>10}{'peak RSS (MB)':>16}")
+    for r in results:
+        print(f"{r['mode']:<16}{r['sequences']:>12,}{r['seconds']:>10.3f}{r['peak_rss_mb']:>16.1f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar protein dataset tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    conv = sub.add_parser("convert", help="Convert combined_protein_dataset.json")
+    conv.add_argument("json_path")
+    conv.add_argument("root")
+
+    bench = sub.add_parser("bench", help="Compare JSON and columnar load time / peak RSS")
+    bench.add_argument("--json", dest="json_path", default="combined_protein_dataset.json")
+    bench.add_argument("--dataset", default="protein_dataset")
+    bench.add_argument("--synthetic", type=int, nargs=5, metavar="N",
+                       help="First write a synthetic collection with these e_coli/yeast/fruit_fly/mouse/human counts")
+
+    measure = sub.add_parser("_measure")
+    measure.add_argument("mode")
+    measure.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        manifest = convert_json(args.json_path, args.root)
+        for part in manifest["partitions"]:
+            print(f"{part['species']:<12}: {part['rows']:>6,} sequences -> {part['path']}")
+        print(f"Wrote {manifest['total_sequences']:,} sequences to {args.root}")
+    elif args.command == "bench":
+        if args.synthetic:
+            species = ["e_coli", "yeast", "fruit_fly", "mouse", "human"]
+            write_synthetic(args.json_path, args.dataset, dict(zip(species, args.synthetic)))
+        benchmark(args.json_path, args.dataset)
+    else:
+        _measure(args.mode, args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Batched validation metrics for ProteinGPT.
+
+All statistics are accumulated on the model's device with tensor reductions
+and index_add_ scatters, so ``update`` never synchronises with the host; the
+only device -> host copy happens in ``compute`` (once per epoch). State is a
+fixed set of counters, so arbitrarily large validation sets stream through
+in constant memory.
+
+    metrics = ValidationMetrics(vocab_size, idx2token=idx2token, device=device)
+    results = evaluate(model, val_loader, device, metrics)
+
+    python protein_eval.py bench --batches 50 --batch-size 32 --seq-len 511
+"""
+
+import argparse
+import math
+import time
+
+import torch
+import torch.nn.functional as F
+
+# ProteinSequenceDataset caps targets at max_len - 1 = 511 tokens, so the last
+# stratum (>256) already covers 257-511
+DEFAULT_LENGTH_BINS = (64, 128, 256)
+
+
+def _safe_div(a, b):
+    """Elementwise a / b with NaN where b == 0."""
+    return torch.where(b > 0, a / b.clamp(min=1), torch.full_like(a, float("nan")))
+
+
+# -----------------------
+# Metric accumulator
+# -----------------------
+class ValidationMetrics:
+    """
+    Streaming per-position accuracy, perplexity, residue confusion matrix and
+    length-stratified metrics for next-token prediction.
+
+    Padding positions (``pad_idx`` in the targets) are ignored everywhere.
+    Sequences are stratified by their unpadded target length into the bins
+    ``[0, b0], (b0, b1], ..., (b_last, inf)``.
+    """
+
+    def __init__(self, vocab_size, pad_idx=0, length_bins=DEFAULT_LENGTH_BINS, idx2token=None, device=None):
+        self.vocab_size = vocab_size
+        self.pad_idx = pad_idx
+        self.idx2token = idx2token
+        self.length_edges = tuple(length_bins)      # host copy, used for labels
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.length_bins = torch.tensor(length_bins, dtype=torch.long, device=self.device)
+        self.reset()
+
+    def reset(self):
+        n_bins = len(self.length_bins) + 1
+        self.correct_per_pos = self._zeros(0)
+        self.total_per_pos = self._zeros(0)
+        self.confusion = self._zeros(self.vocab_size, self.vocab_size)     # rows = target, cols = prediction
+        self.nll_sum = self._zeros((), dtype=torch.float64)
+        self.bin_correct = self._zeros(n_bins)
+        self.bin_total = self._zeros(n_bins)
+        self.bin_nll = self._zeros(n_bins, dtype=torch.float64)
+        self.bin_sequences = self._zeros(n_bins)
+
+    def _zeros(self, *shape, dtype=torch.long):
+        return torch.zeros(*shape, dtype=dtype, device=self.device)
+
+    def _grow_positions(self, T):
+        # T is a tensor shape, so growing never needs a host sync
+        extra = T - self.correct_per_pos.numel()
+        if extra > 0:
+            pad = self._zeros(extra)
+            self.correct_per_pos = torch.cat([self.correct_per_pos, pad])
+            self.total_per_pos = torch.cat([self.total_per_pos, pad])
+
+    @torch.no_grad()
+    def update(self, logits, targets):
+        """Accumulate one batch of ``logits`` (B, T, V) against ``targets`` (B, T)."""
+        B, T = targets.shape
+        self._grow_positions(T)
+
+        mask = targets != self.pad_idx                               # (B, T)
+        preds = logits.argmax(dim=-1)                                # (B, T)
+        hit = (preds == targets) & mask
+
+        nll = F.cross_entropy(
+            logits.reshape(-1, logits.size(-1)).float(),
+            targets.reshape(-1),
+            reduction="none",
+        ).view(B, T) * mask
+        self.nll_sum += nll.sum(dtype=torch.float64)
+
+        # per-position accuracy
+        self.correct_per_pos[:T] += hit.sum(dim=0)
+        self.total_per_pos[:T] += mask.sum(dim=0)
+
+        # target x prediction confusion, padding contributes zero weight
+        cell = (targets * self.vocab_size + preds).reshape(-1)
+        self.confusion.view(-1).index_add_(0, cell, mask.reshape(-1).long())
+
+        # length-stratified
+        lengths = mask.sum(dim=1)                                    # (B,)
+        bins = torch.bucketize(lengths, self.length_bins)
+        self.bin_correct.index_add_(0, bins, hit.sum(dim=1))
+        self.bin_total.index_add_(0, bins, lengths)
+        self.bin_nll.index_add_(0, bins, nll.sum(dim=1, dtype=torch.float64))
+        self.bin_sequences.index_add_(0, bins, (lengths > 0).long())
+
+    def compute(self):
+        """Copy the accumulators to the host in a single transfer and derive metrics."""
+        state = [
+            self.correct_per_pos, self.total_per_pos, self.confusion.view(-1), self.nll_sum.view(1),
+            self.bin_correct, self.bin_total, self.bin_nll, self.bin_sequences,
+        ]
+        flat = torch.cat([t.to(torch.float64) for t in state]).cpu()
+        (correct_pos, total_pos, confusion, nll_sum,
+         bin_correct, bin_total, bin_nll, bin_seqs) = torch.split(flat, [t.numel() for t in state])
+        confusion = confusion.view(self.vocab_size, self.vocab_size).long()
+
+        total = total_pos.sum().item()
+        correct = correct_pos.sum().item()
+
+        row_totals = confusion.sum(dim=1).double()
+        residue_acc = _safe_div(confusion.diagonal().double(), row_totals)
+        per_residue = {}
+        for idx in range(self.vocab_size):
+            if idx == self.pad_idx:
+                continue
+            name = self.idx2token.get(idx, str(idx)) if self.idx2token else str(idx)
+            per_residue[name] = {"accuracy": residue_acc[idx].item(), "count": int(row_totals[idx].item())}
+
+        edges = [0, *self.length_edges]
+        length_strata = []
+        for i in range(len(edges)):
+            label = f"{edges[i] + 1 if i else 0}-{edges[i + 1]}" if i + 1 < len(edges) else f">{edges[i]}"
+            n_tok = bin_total[i].item()
+            length_strata.append({
+                "lengths": label,
+                "sequences": int(bin_seqs[i].item()),
+                "tokens": int(n_tok),
+                "accuracy": bin_correct[i].item() / n_tok if n_tok else float("nan"),
+                "perplexity": math.exp(bin_nll[i].item() / n_tok) if n_tok else float("nan"),
+            })
+
+        return {
+            "tokens": int(total),
+            "accuracy": correct / total if total else float("nan"),
+            "perplexity": math.exp(nll_sum.item() / total) if total else float("nan"),
+            "per_position_accuracy": _safe_div(correct_pos, total_pos),
+            "per_position_count": total_pos.long(),
+            "confusion": confusion,
+            "per_residue": per_residue,
+            "length_strata": length_strata,
+        }
+
+
+def evaluate(model, loader, device, metrics):
+    """Run ``model`` over ``loader`` and return ``metrics.compute()``."""
+    model.eval()
+    metrics.reset()
+    with torch.no_grad():
+        for input_ids, target_ids in loader:
+            input_ids = input_ids.to(device, non_blocking=True)
+            target_ids = target_ids.to(device, non_blocking=True)
+            metrics.update(model(input_ids), target_ids)
+    return metrics.compute()
+
+
+# -----------------------
+# Benchmark against the notebook loop
+# -----------------------
+def legacy_per_position(batches, max_positions):
+    """The original Model_Train per-position accuracy loop (two .item() per position)."""
+    correct_per_pos = torch.zeros(max_positions, dtype=torch.long)
+    total_per_pos = torch.zeros(max_positions, dtype=torch.long)
+    for logits, target_ids in batches:
+        preds = logits.argmax(dim=-1)
+        B, T = target_ids.shape
+        for pos in range(T):
+            if pos >= max_positions:
+                break
+            t_pos = target_ids[:, pos]
+            m_pos = t_pos != 0
+            if m_pos.any():
+                total_per_pos[pos] += m_pos.sum().item()
+                correct_per_pos[pos] += (preds[:, pos][m_pos] == t_pos[m_pos]).sum().item()
+    return correct_per_pos, total_per_pos
+
+
+def _sync(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def benchmark(n_batches=50, batch_size=32, seq_len=511, vocab_size=21, device="cpu", seed=0):
+    """Time both implementations on identical random batches; model cost is excluded."""
+    device = torch.device(device)
+    g = torch.Generator().manual_seed(seed)
+    batches = []
+    for _ in range(n_batches):
+        lengths = torch.randint(2, seq_len + 1, (batch_size,), generator=g)
+        targets = torch.randint(1, vocab_size, (batch_size, seq_len), generator=g)
+        targets[torch.arange(seq_len)[None, :] >= lengths[:, None]] = 0
+        logits = torch.randn(batch_size, seq_len, vocab_size, generator=g)
+        batches.append((logits.to(device), targets.to(device)))
+
+    _sync(device)
+    start = time.perf_counter()
+    legacy_correct, legacy_total = legacy_per_position(batches, seq_len)
+    _sync(device)
+    legacy_s = time.perf_counter() - start
+
+    metrics = ValidationMetrics(vocab_size, device=device)
+    _sync(device)
+    start = time.perf_counter()
+    for logits, targets in batches:
+        metrics.update(logits, targets)
+    results = metrics.compute()
+    batched_s = time.perf_counter() - start
+
+    assert torch.equal(results["per_position_count"], legacy_total.cpu())
+    assert torch.equal(
+        (results["per_position_accuracy"].nan_to_num(0) * results["per_position_count"]).round().long(),
+        legacy_correct.cpu(),
+    )
+    print(f"{n_batches} batches x {batch_size} x {seq_len} on {device}")
+    print(f"  legacy per-position loop : {legacy_s:8.3f} s  (per-position accuracy only)")
+    print(f"  ValidationMetrics        : {batched_s:8.3f} s  (all metrics)")
+    print(f"  speed-up                 : {legacy_s / batched_s:8.1f}x")
+    return legacy_s, batched_s
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ProteinGPT validation metrics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Compare against the per-position loop in Model_Train")
+    bench.add_argument("--batches", type=int, default=50)
+    bench.add_argument("--batch-size", type=int, default=32)
+    bench.add_argument("--seq-len", type=int, default=511)
+    bench.add_argument("--vocab-size", type=int, default=21)
+    bench.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args(argv)
+    benchmark(args.batches, args.batch_size, args.seq_len, args.vocab_size, args.device)
+
+
+if __name__ == "__main__":
+    main()